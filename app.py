@@ -1,16 +1,22 @@
+import collections
+import functools
 import json
+import logging
+import math
 import os
 import re
-import glob
 import time
+import queue
 import threading
 import random
+import sys
+from dataclasses import asdict, dataclass
 from typing import Optional, Dict, Any
 
 # --- FASTAPI & SERVER IMPORTS ---
 try:
-    from fastapi import FastAPI, Request
-    from fastapi.responses import HTMLResponse
+    from fastapi import Depends, FastAPI, Request
+    from fastapi.responses import HTMLResponse, JSONResponse, ORJSONResponse, Response
     from fastapi.staticfiles import StaticFiles
     from fastapi.templating import Jinja2Templates
     from pydantic import BaseModel
@@ -29,6 +35,16 @@ except ImportError:
     SERIAL_AVAILABLE = False
     print("PySerial not found. Serial sensor data disabled.")
 
+try:
+    import orjson  # Optional: faster JSON parse/encode on the serial and /state paths
+except ImportError:
+    orjson = None
+
+try:
+    import re2 as fast_re  # Optional: DFA-based matcher (google-re2/pyre2) for the parse patterns
+except ImportError:
+    fast_re = re
+
 try:
     from gpiozero import Motor, DistanceSensor
     GPIO_AVAILABLE = True
@@ -40,6 +56,103 @@ except ImportError:
 
 HARDWARE_AVAILABLE = GPIO_AVAILABLE
 
+if orjson is not None:
+    _json_loads = orjson.loads
+    _json_dumps = orjson.dumps
+else:
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+# Control loop cadence: distance/motor decisions run every FAST_PERIOD, the
+# slow-changing mock channels (light, soil, temperature) refresh every SLOW_PERIOD
+FAST_PERIOD = 0.05
+SLOW_PERIOD = 1.0
+
+# A fully mocked robot (no STM32, no GPIO) drops to SLOW_PERIOD once no client
+# has read /state for this many seconds
+IDLE_AFTER = 5.0
+
+# A channel the STM32 has reported keeps its serial value across ticks with no new
+# packet; only once it is this old (seconds) do GPIO/mock fallbacks take over
+SERIAL_VALUE_MAX_AGE = 1.0
+
+# CPUs the control loop thread is pinned to on Linux (it stays off core 0, where
+# interrupts and system work tend to land; the server threads are not pinned) and
+# its SCHED_FIFO priority when the process is allowed to use real-time scheduling
+CONTROL_CPUS = {1, 2, 3}
+CONTROL_RT_PRIORITY = 20
+
+# Published sensor readings are quantized to this many decimals (0.1 cm / % / °C);
+# none of the sensors resolve finer, and sub-resolution jitter then no longer
+# counts as a state change worth re-encoding
+STATE_DECIMALS = 1
+
+# Serial read timeout, and the minimum gap between commands written to the STM32
+SERIAL_READ_TIMEOUT = 0.5
+COMMAND_COOLDOWN = 0.3
+
+# Upper bound for buffered serial bytes that never see a newline
+RX_BUFFER_LIMIT = 4096
+
+# Serial chatter goes through logging so the hot path skips formatting unless
+# ROBOT_DEBUG is set; production stays at WARNING.
+DEBUG = os.getenv("ROBOT_DEBUG", "0").lower() in ("1", "true", "yes")
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the newest log records in memory; the oldest drop off once full."""
+
+    def __init__(self, capacity=256):
+        super().__init__()
+        self.records = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append((record.created, record.getMessage()))
+
+
+log = logging.getLogger("robot")
+log.setLevel(logging.DEBUG if DEBUG else logging.WARNING)
+debug_log = RingBufferHandler()
+if not log.handlers:
+    # Debug traffic only lands in the ring buffer (served on /debug); the console
+    # sees warnings and up, so a 10 Hz serial trace never floods uvicorn's stdout
+    _log_handler = logging.StreamHandler()
+    _log_handler.setLevel(logging.WARNING)
+    _log_handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_log_handler)
+    log.addHandler(debug_log)
+
+# First signed integer/decimal inside a sensor value such as "45.2%" or "12 cm"
+_NUM_RE = fast_re.compile(r"-?\d+(?:\.\d+)?")
+
+# One "key:value" pair of the fallback STM32 format, e.g. "[Light Detected: 1, Soil Humidity: 45.2]",
+# matched after _KV_DELETE has stripped brackets and spaces from the raw line
+_KV_RE = fast_re.compile(r"([^,:]+):([^,]*)")
+_KV_DELETE = b"[] "
+
+# Accepted packet keys per sensor. Key:value packets arrive with spaces removed,
+# JSON packets keep them, hence both spellings of "distance (cm)".
+_DIST_KEYS = ("distance", "distance_cm", "range", "distance(cm)", "distance (cm)")
+_LIGHT_KEYS = ("light", "light_val", "lightdetected", "lightval")
+_SOIL_KEYS = ("soil", "soil_val", "soilhumidity", "soilval")
+_TEMP_KEYS = ("temperature", "temperature_c", "temp")
+
+# Reverse map packet key -> RobotController attribute, so a packet is classified in
+# one pass over its own keys instead of probing every alias of every sensor
+_FIELD_MAP = {
+    key: attr
+    for attr, keys in (
+        ("distance", _DIST_KEYS),
+        ("light_val", _LIGHT_KEYS),
+        ("soil_val", _SOIL_KEYS),
+        ("temperature_c", _TEMP_KEYS),
+    )
+    for key in keys
+}
+_INT_FIELDS = frozenset({"light_val"})
+
 # try:
 # 	ser = serial.Serial('/dev/ttyACM0', 115200, timeout=1)
 #	ser.flush()
@@ -70,6 +183,21 @@ class RobotState(BaseModel):
     gesture_detected_at: Optional[str]
 
 
+@dataclass(frozen=True, slots=True)
+class _Snapshot:
+    """Immutable copy of RobotState, swapped in whole so readers never need a lock."""
+    light_val: Optional[int]
+    soil_val: Optional[float]
+    distance_cm: float
+    current_face: str
+    motor_state: str
+    temperature_c: float
+    gesture_label: Optional[str]
+    gesture_mode: Optional[str]
+    gesture_message: Optional[str]
+    gesture_detected_at: Optional[str]
+
+
 class GestureUpdate(BaseModel):
     gesture: Optional[str]
     mode: Optional[str]
@@ -77,8 +205,26 @@ class GestureUpdate(BaseModel):
 # --- 2. Robot Controller ---
 
 class RobotController:
+    # Motor state labels for the speeds _apply_logic uses, built once instead of per tick
+    _MOTOR_STATES = {
+        ("FORWARD", 0.6): "FORWARD (0.6)",
+        ("FORWARD", 1.0): "FORWARD (1.0)",
+        ("ROTATING", 0.8): "ROTATING (0.8)",
+        ("ROTATING", 1.0): "ROTATING (1.0)",
+    }
+
+    # Drive policy while it is light: (soil bucket, distance bucket) -> (face, motor method, speed)
+    # Dry soil (< 30 %) -> tired & slow; otherwise happy & active. Obstacle within 30 cm -> rotate.
+    _DRIVE_POLICY = {
+        ("dry", "far"): (FACES["tired"], "move_forward", 0.6),
+        ("dry", "near"): (FACES["tired"], "rotate", 0.8),
+        ("ok", "far"): (FACES["awake"], "move_forward", 1.0),
+        ("ok", "near"): (FACES["awake"], "rotate", 1.0),
+    }
+
     def __init__(self, port="/dev/ttyACM0", baudrate=115200):
-        self.lock = threading.Lock()
+        self._state_lock = threading.Lock()  # Serializes snapshot writers only; readers are lock-free
+        self._outbox_lock = threading.Lock()  # Guards the pending STM32 command below
         self._stop_event = threading.Event()
         
         # State initialization
@@ -87,19 +233,37 @@ class RobotController:
         self.soil_val: Optional[float] = 50.0
         self.distance: float = 0.0
         self.motor_state: str = "STOPPED"
+        self._last_motor = None  # (action, speed) last sent to the drivers
         self.temperature_c: float = 24.0
         self.gesture_label: Optional[str] = None
         self.gesture_mode: Optional[str] = None
         self.gesture_message: Optional[str] = "No gesture detected"
         self.gesture_detected_at: Optional[str] = None
+        self._snapshot: Optional[_Snapshot] = None
+        self._state_json: bytes = b""
+        self._publish()
 
         # --- Hardware Setup ---
         self.serial_conn = None
         self.serial_port = port
         self.serial_baudrate = baudrate
         self.serial_error_count = 0
-        self.last_reconnect_attempt = 0
-        self.last_command_sent = 0  # Timestamp of last command sent to STM32
+        self.last_reconnect_attempt = 0.0  # time.monotonic() seconds
+        self.last_command_sent = 0.0  # time.monotonic() of last command sent to STM32
+        self._pending_command = None  # Newest (command, mode) not yet written; older ones are dropped
+        self._last_slow = 0.0  # Last refresh of the slow sensor tier
+        self._last_observed = 0.0  # time.monotonic() of the last state read
+        # (attribute, convert serial value, fallback) per sensor
+        self._sensor_spec = (
+            ("distance", None, self._fallback_distance),
+            ("light_val", None, self._fallback_light),
+            ("soil_val", self._soil_percent, self._fallback_soil),
+            ("temperature_c", None, self._fallback_temperature),
+        )
+        self._serial_seen_at: Dict[str, float] = {}  # attr -> time.monotonic() of its last serial value
+        self._rx_buf = bytearray()  # Bytes received but not yet terminated by a newline
+        self._rx_q = queue.SimpleQueue()  # Parsed packets handed from the serial thread to _loop
+        self._rx_ready = threading.Event()  # Set when a packet is queued, wakes _loop early
         self.motor_right = None
         self.motor_left = None
         self.distance_sensor = None
@@ -111,9 +275,15 @@ class RobotController:
         # GPIO hardware setup (motors, ultrasonic)
         if GPIO_AVAILABLE and Motor and DistanceSensor:
             try:
-                self.distance_sensor = DistanceSensor(echo=23, trigger=24)
+                # gpiozero pings the HC-SR04 on its own background thread and keeps a
+                # moving average, so .distance is a cheap cached read. Reads wait only
+                # until the short queue first fills (~0.3 s); partial=True is avoided
+                # because an empty queue reads as 0 cm, i.e. an obstacle at boot.
+                self.distance_sensor = DistanceSensor(echo=23, trigger=24, queue_len=5)
                 self.motor_right = Motor(forward=27, backward=22)
                 self.motor_left = Motor(forward=16, backward=20)
+                # Take the one blocking read here so the control loop starts on a real distance
+                self.distance = self.distance_sensor.distance * 100
                 print("GPIO hardware initialized.")
             except Exception as exc:
                 print(f"GPIO initialization failed ({exc}). Switching to mock drive mode.")
@@ -125,9 +295,16 @@ class RobotController:
         if self.use_mock_hardware:
             print("--- RUNNING DRIVE HARDWARE IN MOCK MODE ---")
 
-        # Start background thread
+        # Background threads: serial I/O blocks on its own so it never stalls control logic.
+        # They run for the lifetime of the web app, see start()/close().
+        self._serial_thread = threading.Thread(target=self._serial_reader_loop, daemon=True)
         self._thread = threading.Thread(target=self._loop, daemon=True)
-        self._thread.start()
+
+    def start(self):
+        """Starts the serial and control threads (called from the app's startup hook)."""
+        if not self._thread.is_alive():
+            self._serial_thread.start()
+            self._thread.start()
 
     def _init_serial_connection(self, preferred_port, baudrate):
         if not SERIAL_AVAILABLE:
@@ -138,7 +315,7 @@ class RobotController:
         if preferred_port:
             candidate_ports.append(preferred_port)
 
-        auto_ports = sorted(glob.glob("/dev/ttyACM*") + glob.glob("/dev/ttyUSB*"))
+        auto_ports = self._scan_serial_ports()
         for candidate in auto_ports:
             if candidate not in candidate_ports:
                 candidate_ports.append(candidate)
@@ -150,10 +327,11 @@ class RobotController:
         for candidate in candidate_ports:
             try:
                 # Try to open with exclusive access
-                conn = serial.Serial(candidate, baudrate, timeout=0.5, exclusive=True)
+                conn = serial.Serial(candidate, baudrate, timeout=SERIAL_READ_TIMEOUT, exclusive=True)
                 time.sleep(0.2)  # Allow connection to stabilize
                 conn.reset_input_buffer()
                 conn.reset_output_buffer()
+                self._enable_low_latency(conn)
                 print(f"✓ Serial connected on {candidate} @ {baudrate} bps")
                 return conn
             except serial.SerialException as exc:
@@ -166,58 +344,101 @@ class RobotController:
         print("✗ Unable to open any serial ports. Running with mock data.")
         return None
 
+    @staticmethod
+    def _scan_serial_ports():
+        """Lists /dev/ttyACM* and /dev/ttyUSB* with a single directory walk."""
+        try:
+            with os.scandir("/dev") as entries:
+                return sorted(
+                    "/dev/" + entry.name for entry in entries
+                    if entry.name.startswith(("ttyACM", "ttyUSB"))
+                )
+        except OSError:
+            return []  # No /dev (e.g. Windows dev machine)
+
+    @staticmethod
+    def _enable_low_latency(conn):
+        """Sets ASYNC_LOW_LATENCY so USB-serial adapters deliver short lines immediately.
+
+        FTDI-style drivers otherwise batch input for up to 16 ms. pyserial issues the
+        TIOCGSERIAL/TIOCSSERIAL ioctl pair on Linux; drivers without it (e.g. older
+        cdc-acm) refuse, in which case the port simply keeps its default buffering.
+        """
+        try:
+            conn.set_low_latency_mode(True)
+        except (AttributeError, NotImplementedError, ValueError, OSError):
+            pass
+
     # --- Motor Abstractions ---
 
     def _set_motor_state(self, state_text):
-        with self.lock:
-            self.motor_state = state_text
+        self.motor_state = state_text
+
+    def _motor_label(self, action, speed):
+        label = self._MOTOR_STATES.get((action, speed))
+        return label if label is not None else f"{action} ({speed})"
+
+    def _motor_unchanged(self, action, speed=None):
+        # The control loop re-issues the same command every tick; only changes reach GPIO
+        key = (action, speed)
+        if key == self._last_motor:
+            return True
+        self._last_motor = key
+        return False
 
     def stop_motors(self):
+        if self._motor_unchanged("STOPPED"):
+            return
         if not self.use_mock_hardware:
             self.motor_right.stop()
             self.motor_left.stop()
         self._set_motor_state("STOPPED")
 
     def move_forward(self, speed=1.0):
+        if self._motor_unchanged("FORWARD", speed):
+            return
         if not self.use_mock_hardware:
             self.motor_right.forward(speed)
             self.motor_left.forward(speed)
-        self._set_motor_state(f"FORWARD ({speed})")
+        self._set_motor_state(self._motor_label("FORWARD", speed))
 
     def rotate(self, speed=1.0):
+        if self._motor_unchanged("ROTATING", speed):
+            return
         if not self.use_mock_hardware:
             self.motor_left.forward(speed)
             self.motor_right.backward(speed)
-        self._set_motor_state(f"ROTATING ({speed})")
+        self._set_motor_state(self._motor_label("ROTATING", speed))
 
     # --- Sensor Logic ---
 
     def _reconnect_serial(self):
         """Attempt to reconnect to serial port after disruption."""
-        current_time = time.time()
+        current_time = time.monotonic()
         # Only try reconnecting once every 5 seconds
         if current_time - self.last_reconnect_attempt < 5:
             return False
         
         self.last_reconnect_attempt = current_time
-        print("[SERIAL] Attempting to reconnect...")
+        log.info("[SERIAL] Attempting to reconnect...")
         
-        with self.lock:  # Protect serial connection changes
-            # Close existing connection if any
-            if self.serial_conn:
-                try:
-                    self.serial_conn.close()
-                except:
-                    pass
-                self.serial_conn = None
-            
-            # Try to reconnect
-            new_conn = self._init_serial_connection(self.serial_port, self.serial_baudrate)
-            if new_conn:
-                self.serial_conn = new_conn
-                self.serial_error_count = 0
-                print("[SERIAL] Reconnection successful!")
-                return True
+        # Only the serial thread reads, writes and swaps the connection, so no lock needed
+        # Close existing connection if any
+        if self.serial_conn:
+            try:
+                self.serial_conn.close()
+            except:
+                pass
+            self.serial_conn = None
+        self._rx_buf.clear()
+
+        # Try to reconnect
+        new_conn = self._init_serial_connection(self.serial_port, self.serial_baudrate)
+        if new_conn:
+            self.serial_conn = new_conn
+            self.serial_error_count = 0
+            log.info("[SERIAL] Reconnection successful!")
+            return True
         return False
 
     def _read_serial_packet(self):
@@ -227,62 +448,70 @@ class RobotController:
             return {}
 
         try:
-            # Read line with timeout (set in serial connection)
-            raw = self.serial_conn.readline().decode("utf-8", errors="replace").strip()
-            if not raw:
-                return {}  # Timeout or empty line
+            # Block (up to the port timeout) for the first byte, then drain everything
+            # the OS has buffered in the same call instead of one line at a time
+            self._rx_buf += self.serial_conn.read(self.serial_conn.in_waiting or 1)
+            end = self._rx_buf.rfind(b"\n")
+            if end < 0:
+                if len(self._rx_buf) > RX_BUFFER_LIMIT:
+                    self._rx_buf.clear()  # No framing in sight, drop the noise
+                return {}
 
-            # Debug: Print raw data (comment out after testing)
-            print(f"[SERIAL] Raw: {raw}")
+            # Only the newest complete line matters: slice it out and keep the partial
+            # tail in place for the next read. The line stays bytes until it is parsed.
+            start = self._rx_buf.rfind(b"\n", 0, end) + 1
+            line = bytes(self._rx_buf[start:end]).strip()
+            del self._rx_buf[:end + 1]
+            if not line:
+                return {}  # Empty line
+
+            # Debug: raw data (visible with ROBOT_DEBUG=1)
+            log.debug("[SERIAL] Raw: %r", line)
             
             # Detect garbage/corrupted data (single char or very short)
             # But ignore short responses within 1 second of sending a command (STM32 might echo)
-            if len(raw) < 5 or not any(c in raw for c in [':', '[', '{']):
-                if time.time() - self.last_command_sent < 1.0:
+            if len(line) < 5 or not (b":" in line or b"[" in line or b"{" in line):
+                if time.monotonic() - self.last_command_sent < 1.0:
                     # Likely echo from our command, ignore silently
                     return {}
                 self.serial_error_count += 1
                 if self.serial_error_count >= 5:  # Increased threshold
-                    print(f"[SERIAL] Too many errors ({self.serial_error_count}), triggering reconnection...")
+                    log.warning("[SERIAL] Too many errors (%d), triggering reconnection...", self.serial_error_count)
                     self._reconnect_serial()
                 return {}
 
             # Reset error count on successful read
             self.serial_error_count = 0
 
-            # Try JSON payload first
-            try:
-                parsed = json.loads(raw)
-                if isinstance(parsed, dict):
-                    result = {str(k).strip().lower(): parsed[k] for k in parsed}
-                    print(f"[SERIAL] Parsed JSON: {result}")
-                    return result
-            except json.JSONDecodeError:
-                pass
+            # Try JSON payload first (only objects are useful, so skip the attempt otherwise)
+            if line.startswith(b"{"):
+                try:
+                    parsed = _json_loads(line)
+                    if isinstance(parsed, dict):
+                        result = {str(k).strip().lower(): v for k, v in parsed.items()}
+                        log.debug("[SERIAL] Parsed JSON: %s", result)
+                        return result
+                except ValueError:  # JSONDecodeError, or UnicodeDecodeError on line noise
+                    pass
 
             # Fallback: key:value comma-separated string
-            cleaned = raw.replace("[", "").replace("]", "")
-            packet = {}
-            for part in cleaned.split(","):
-                if ":" not in part:
-                    continue
-                key, value = part.split(":", 1)
-                # Normalize key by removing spaces and converting to lowercase
-                normalized_key = key.strip().lower().replace(" ", "")
-                packet[normalized_key] = value.strip()
-            
+            # One C-level pass drops brackets and spaces (normalizing keys like
+            # "Light Detected" -> "lightdetected"), then decode (STM32 output is ASCII)
+            raw = line.translate(None, _KV_DELETE).decode("ascii", errors="replace")
+            packet = {key.lower(): value for key, value in _KV_RE.findall(raw)}
+
             if packet:
-                print(f"[SERIAL] Parsed key-value: {packet}")
+                log.debug("[SERIAL] Parsed key-value: %s", packet)
             else:
                 # Empty packet might indicate corruption
                 self.serial_error_count += 1
             return packet
         except (serial.SerialException, OSError) as e:
-            print(f"[SERIAL] Connection error: {e}")
+            log.warning("[SERIAL] Connection error: %s", e)
             self._reconnect_serial()
             return {}
         except Exception as e:
-            print(f"[SERIAL] Error reading: {e}")
+            log.warning("[SERIAL] Error reading: %s", e)
             self.serial_error_count += 1
             if self.serial_error_count >= 5:
                 self._reconnect_serial()
@@ -290,95 +519,184 @@ class RobotController:
 
     @staticmethod
     def _coerce_numeric(value):
-        if isinstance(value, (int, float)):
-            return float(value)
-        match = re.search(r"-?\d+(?:\.\d+)?", str(value))
-        if match:
-            try:
-                return float(match.group())
-            except ValueError:
-                return None
-        return None
+        # Fast path: JSON numbers and clean numeric strings need no regex
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            pass
+        else:
+            if math.isfinite(number):  # float() also accepts "nan"/"inf"
+                return number
+        match = _NUM_RE.search(value if isinstance(value, str) else str(value))
+        return float(match.group()) if match else None
+
+    def _extract_readings(self, packet):
+        """Maps a packet onto sensor attributes; the first numeric alias per sensor wins."""
+        readings = {}
+        for key, value in packet.items():
+            attr = _FIELD_MAP.get(key)
+            if attr is None or attr in readings:
+                continue
+            number = self._coerce_numeric(value)
+            if number is not None:
+                readings[attr] = int(number) if attr in _INT_FIELDS else number
+        return readings
+
+    def _serial_reader_loop(self):
+        """Serial thread: waits for STM32 data, queues every parsed packet and sends commands."""
+        while not self._stop_event.is_set():
+            packet = self._read_serial_packet()
+            if packet:
+                self._rx_q.put(packet)
+                self._rx_ready.set()
+            elif not self.serial_conn:
+                self._stop_event.wait(0.5)  # Nothing to block on until a reconnect succeeds
+                continue
+            self._flush_outbox()
+
+    def _flush_outbox(self):
+        """Writes the newest pending command, if any, once the cooldown has passed."""
+        if self._pending_command is None:
+            return
+        current_time = time.monotonic()
+        remaining = COMMAND_COOLDOWN - (current_time - self.last_command_sent)
+        try:
+            if remaining > 0:
+                # Stays pending (a newer command may still replace it); cut the next read
+                # short so the serial thread is back here when the cooldown ends
+                self.serial_conn.timeout = remaining
+                return
+            if self.serial_conn.timeout != SERIAL_READ_TIMEOUT:
+                self.serial_conn.timeout = SERIAL_READ_TIMEOUT
+        except Exception as e:
+            log.warning("[SERIAL] Error: %s", e)
+            return
+        with self._outbox_lock:
+            command, mode = self._pending_command
+            self._pending_command = None
+        try:
+            # Send ONLY the command byte, no newline!
+            self.serial_conn.write(command.encode('utf-8'))
+            self.serial_conn.flush()
+            self.last_command_sent = current_time
+            log.debug("[SERIAL] Sent to STM32: '%s' (mode: %s)", command, mode)
+        except Exception as e:
+            log.warning("[SERIAL] Error: %s", e)
 
-    def _extract_serial_number(self, packet, keys, as_int=False):
-        for key in keys:
-            if key in packet:
-                number = self._coerce_numeric(packet[key])
-                if number is not None:
-                    return int(number) if as_int else float(number)
-        return None
+    def _drain_packets(self):
+        """Merges every packet queued since the last tick; newer values win."""
+        packet = {}
+        try:
+            while True:
+                packet.update(self._rx_q.get_nowait())
+        except queue.Empty:
+            pass
+        return packet
 
-    def _read_sensors(self):
-        """Reads real hardware or generates mock data."""
-
-        packet = self._read_serial_packet()
-
-        # Distance from STM32 payload (fallback to GPIO sensor, then mock)
-        dist_cm = self._extract_serial_number(packet, (
-            "distance", "distance_cm", "range", "distance (cm)"
-        ))
-
-        if dist_cm is None and not self.use_mock_hardware and self.distance_sensor:
-            dist_cm = self.distance_sensor.distance * 100
-        elif dist_cm is None and self.distance:
-            dist_cm = self.distance
-        elif dist_cm is None:
-            dist_cm = random.uniform(10, 100)
-
-        # Light & soil moisture from serial
-        l_val = self._extract_serial_number(packet, (
-            "light", "light_val", "lightdetected", "lightval"
-        ), as_int=True)
-        s_val = self._extract_serial_number(packet, (
-            "soil", "soil_val", "soilhumidity", "soilval"
-        ))
-        
+    # --- Per-channel fallbacks when the serial packet has no value ---
+
+    def _fallback_distance(self, slow_due):
+        # GPIO ultrasonic sensor, then last known value, then mock
+        if not self.use_mock_hardware and self.distance_sensor:
+            return self.distance_sensor.distance * 100
+        if self.distance:
+            return self.distance
+        return random.uniform(10, 100)
+
+    def _fallback_light(self, slow_due):
+        if self.serial_conn or not slow_due:
+            return self.light_val
+        # No serial hardware at all -> mock light (slow tier)
+        if random.random() > 0.95:
+            return 1 if self.light_val == 0 else 0
+        return self.light_val
+
+    def _fallback_soil(self, slow_due):
+        if self.serial_conn or not slow_due:
+            return self.soil_val
+        # No serial hardware at all -> mock soil (slow tier)
+        return max(0, min(100, (self.soil_val or 50.0) + random.uniform(-2, 2)))
+
+    def _fallback_temperature(self, slow_due):
+        # Realistic mock data (~24-25°C with small variations), refreshed on the slow tier
+        return 24.5 + random.uniform(-0.5, 0.5) if slow_due else self.temperature_c
+
+    @staticmethod
+    def _soil_percent(value):
         # Convert soil from 0-1 range to 0-100 percentage if needed
-        if s_val is not None and s_val <= 1.0:
-            s_val = s_val * 100.0
-
-        if l_val is None and s_val is None and (not packet) and not self.serial_conn:
-            # No serial hardware at all -> mock light/soil
-            l_val = self.light_val
-            if random.random() > 0.95:
-                l_val = 1 if l_val == 0 else 0
-            s_val = self.soil_val
-            change = random.uniform(-2, 2)
-            s_val = max(0, min(100, (s_val or 50.0) + change))
-        else:
-            if l_val is None:
-                l_val = self.light_val
-            if s_val is None:
-                s_val = self.soil_val
-
-        # Temperature (priority: serial > realistic mock)
-        temp = self._extract_serial_number(packet, (
-            "temperature", "temperature_c", "temp"
-        ))
-        
-        # Realistic mock data (~24-25°C with small variations)
-        if temp is None:
-            temp = 24.5 + random.uniform(-0.5, 0.5)
+        return value * 100.0 if value <= 1.0 else value
 
-        return dist_cm, l_val, s_val, temp
+    def _read_sensors(self):
+        """Refreshes every sensor attribute from serial data or its fallback."""
+
+        packet = self._drain_packets()
+
+        now = time.monotonic()
+        slow_due = now - self._last_slow >= SLOW_PERIOD
+        if slow_due:
+            self._last_slow = now
+
+        readings = self._extract_readings(packet)
+        seen_at = self._serial_seen_at
+        for attr, convert, fallback in self._sensor_spec:
+            value = readings.get(attr)
+            if value is not None:
+                if convert:
+                    value = convert(value)
+                seen_at[attr] = now
+            elif self.serial_conn and now - seen_at.get(attr, -math.inf) <= SERIAL_VALUE_MAX_AGE:
+                continue  # Between packets: keep the STM32's value rather than mixing sources
+            else:
+                value = fallback(slow_due)
+            setattr(self, attr, value)
+
+    @staticmethod
+    def _pin_control_thread():
+        """Keeps the calling thread off the web server's core and gives it real-time priority."""
+        if sys.platform != "linux":
+            return
+        cpus = CONTROL_CPUS & os.sched_getaffinity(0)
+        if cpus:
+            os.sched_setaffinity(0, cpus)  # pid 0 = calling thread on Linux
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(CONTROL_RT_PRIORITY))
+        except PermissionError:
+            pass  # Needs root or CAP_SYS_NICE; keep default scheduling
 
     def _loop(self):
         """Main autonomous loop."""
+        self._pin_control_thread()
+        # Ticks are scheduled on absolute deadlines so the work time does not add up
+        # into drift; a packet-driven early wake leaves the deadline where it is
+        deadline = time.monotonic() + FAST_PERIOD
         while not self._stop_event.is_set():
             # 1. Get Data
-            dist, light, soil, temp = self._read_sensors()
-
-            with self.lock:
-                self.distance = dist
-                self.light_val = light
-                self.soil_val = soil
-                self.temperature_c = temp
+            self._read_sensors()
 
             # 2. Apply Logic
-            self._apply_logic(dist, light, soil)
-
-            # 3. Wait
-            time.sleep(0.1) # Update frequency - faster polling for serial data
+            self._apply_logic(self.distance, self.light_val, self.soil_val)
+            self._publish()
+
+            # 3. Wait for the next fast tick, or less if the STM32 sends something first
+            now = time.monotonic()
+            if self._idle(now):
+                # Nothing real to control and nobody watching the mock data
+                self._stop_event.wait(SLOW_PERIOD)
+                deadline = time.monotonic() + FAST_PERIOD
+                continue
+            if now >= deadline:
+                deadline += FAST_PERIOD
+                if deadline <= now:
+                    deadline = now + FAST_PERIOD  # Fell a whole period behind: skip, don't burst
+            self._rx_ready.wait(deadline - now)
+            self._rx_ready.clear()
+
+    def _idle(self, now):
+        return (
+            self.serial_conn is None
+            and self.use_mock_hardware
+            and now - self._last_observed > IDLE_AFTER
+        )
 
     def _apply_logic(self, dist, light, soil):
         """Decides face and movement based on sensors."""
@@ -393,37 +711,47 @@ class RobotController:
         if light == 0:
             self.current_face = FACES["sleep"]
             self.stop_motors()
-        
-        # Logic 3: Dry Soil -> Tired & Slow
-        elif soil < 30:
-            self.current_face = FACES["tired"]
-            if dist > 30:
-                self.move_forward(0.6)
-            else:
-                self.rotate(0.8)
-        
-        # Logic 4: Happy & Active
-        else:
-            self.current_face = FACES["awake"]
-            if dist > 30:
-                self.move_forward(1.0)
-            else:
-                self.rotate(1.0)
+            return
 
-    def get_state(self) -> RobotState:
-        with self.lock:
-            return RobotState(
+        # Logic 3/4: one lookup on (soil bucket, distance bucket)
+        face, action, speed = self._DRIVE_POLICY[
+            "dry" if soil < 30 else "ok",
+            "far" if dist > 30 else "near",
+        ]
+        self.current_face = face
+        getattr(self, action)(speed)
+
+    def _publish(self):
+        """Builds a fresh snapshot and swaps it in with a single attribute store.
+
+        The JSON body for /state is rendered here too, once per change, so polling
+        clients get cached bytes instead of a model build + encode per request.
+        """
+        with self._state_lock:
+            snapshot = _Snapshot(
                 light_val=self.light_val,
-                soil_val=self.soil_val,
-                distance_cm=self.distance,
+                soil_val=None if self.soil_val is None else round(self.soil_val, STATE_DECIMALS),
+                distance_cm=round(self.distance, STATE_DECIMALS),
                 current_face=self.current_face,
                 motor_state=self.motor_state,
-                temperature_c=self.temperature_c,
+                temperature_c=round(self.temperature_c, STATE_DECIMALS),
                 gesture_label=self.gesture_label,
                 gesture_mode=self.gesture_mode,
                 gesture_message=self.gesture_message,
                 gesture_detected_at=self.gesture_detected_at
             )
+            if snapshot == self._snapshot:
+                return  # Nothing changed, keep the cached body
+            self._snapshot = snapshot
+            self._state_json = _json_dumps(asdict(snapshot))
+
+    def get_state(self) -> RobotState:
+        self._last_observed = time.monotonic()
+        return RobotState(**asdict(self._snapshot))
+
+    def get_state_json(self) -> bytes:
+        self._last_observed = time.monotonic()
+        return self._state_json
 
     def update_gesture(self, label: Optional[str], mode: Optional[str]):
         # Mode mapping for STM32
@@ -434,7 +762,7 @@ class RobotController:
             None: '3'
         }
         
-        with self.lock:
+        with self._state_lock:
             self.gesture_label = label
             self.gesture_mode = mode
 
@@ -445,27 +773,26 @@ class RobotController:
             else:
                 self.gesture_message = "No gesture detected"
                 self.gesture_detected_at = None
+        self._publish()
         
-        # Send command to STM32
+        # Queue command for the serial thread; rapid updates collapse to the newest one
         # IMPORTANT: Do NOT send \n - STM32 reads 1 byte at a time, \n would be read
         # as a separate command and trigger the "else" clause which stops motors!
-        if self.serial_conn and mode in MODE_MAP:
-            current_time = time.time()
-            if current_time - self.last_command_sent >= 0.3:  # 0.3 second cooldown
-                try:
-                    command = MODE_MAP[mode]
-                    # Send ONLY the command byte, no newline!
-                    self.serial_conn.write(command.encode('utf-8'))
-                    self.serial_conn.flush()
-                    self.last_command_sent = current_time
-                    print(f"[SERIAL] Sent to STM32: '{command}' (mode: {mode})")
-                    
-                except Exception as e:
-                    print(f"[SERIAL] Error: {e}")
+        conn = self.serial_conn
+        if conn and mode in MODE_MAP:
+            with self._outbox_lock:
+                self._pending_command = (MODE_MAP[mode], mode)
+            try:
+                conn.cancel_read()  # Wake the serial thread out of its blocking read
+            except Exception:
+                pass  # Port closing/reconnecting; the command goes out on the next pass
 
     def close(self):
         self._stop_event.set()
-        self._thread.join(timeout=1)
+        for thread in (self._thread, self._serial_thread):
+            if thread.is_alive():
+                thread.join(timeout=1)
+        self._last_motor = None  # Always send the final stop
         self.stop_motors()
         if self.serial_conn:
             self.serial_conn.close()
@@ -477,29 +804,72 @@ class RobotController:
 
 # --- 3. Web Server Setup ---
 
-app = FastAPI()
+# orjson renders the remaining JSON routes (/gesture, /debug) in C when installed
+app = FastAPI(default_response_class=ORJSONResponse if orjson is not None else JSONResponse)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 templates = Jinja2Templates(directory="templates")
 
-robot = RobotController()
+@functools.lru_cache(maxsize=1)
+def get_robot() -> RobotController:
+    # Built on first use so importing the module never opens the serial port or GPIO
+    return RobotController()
+
+async def get_robot_dep() -> RobotController:
+    # async so FastAPI calls it inline instead of through the threadpool per request
+    return get_robot()
+
+@app.on_event("startup")
+def startup_event():
+    get_robot().start()
 
 @app.on_event("shutdown")
 def shutdown_event():
-    robot.close()
+    if get_robot.cache_info().currsize:
+        get_robot().close()
+        get_robot.cache_clear()  # A later startup in this process builds a fresh controller
 
-@app.get("/state", response_model=RobotState)
-async def get_state():
-    return robot.get_state()
+@app.get("/state", responses={200: {"model": RobotState}})
+async def get_state(robot: RobotController = Depends(get_robot_dep)):
+    # Pre-rendered in RobotController._publish; skips response_model validation
+    return Response(content=robot.get_state_json(), media_type="application/json")
 
 @app.post("/gesture")
-async def ingest_gesture(update: GestureUpdate):
+async def ingest_gesture(update: GestureUpdate, robot: RobotController = Depends(get_robot_dep)):
+    # Only records state and queues the STM32 command for the serial thread
     robot.update_gesture(update.gesture, update.mode)
     return {"status": "ok"}
 
+@app.get("/debug")
+async def get_debug_log():
+    # Newest serial/debug log lines (DEBUG entries need ROBOT_DEBUG=1)
+    return [{"time": created, "message": message} for created, message in debug_log.records.copy()]
+
+# Rendered dashboard pages by base URL: url_for() in the template builds absolute links,
+# so the page only differs per host it is reached under
+_dashboard_pages: Dict[str, HTMLResponse] = {}
+DASHBOARD_CACHE_HOSTS = 8
+
 @app.get("/", response_class=HTMLResponse)
 async def dashboard(request: Request):
-    return templates.TemplateResponse("dashboard.html", {"request": request})
+    key = str(request.base_url)
+    page = _dashboard_pages.get(key)
+    if page is None:
+        if len(_dashboard_pages) >= DASHBOARD_CACHE_HOSTS:
+            _dashboard_pages.clear()  # Bound the cache against arbitrary Host headers
+        body = templates.get_template("dashboard.html").render(request=request)
+        page = _dashboard_pages[key] = HTMLResponse(body, headers={"Cache-Control": "public, max-age=3600"})
+    return page
 
 if __name__ == "__main__":
     print("Starting Robot Server...")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop + httptools ship with uvicorn[standard]; dropping the access log saves
+    # per-request formatting on the Pi where the control loop shares the CPU
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        log_level="warning",
+        access_log=False,
+    )
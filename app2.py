@@ -1,12 +1,25 @@
+import functools
+import json
+import re
 import serial
 import time
 import threading
 import os
+from typing import TypedDict
 from gpiozero import Motor, DistanceSensor
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from fastapi import Depends, FastAPI, Request
+from fastapi.responses import HTMLResponse, Response
 from pydantic import BaseModel
 
+try:
+    import orjson
+    _json_dumps = orjson.dumps
+except ImportError:
+    orjson = None
+
+    def _json_dumps(obj) -> bytes:
+        return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
 # --- 1. Robot Face States and Data Model ---
 
 FACES = {
@@ -16,6 +29,13 @@ FACES = {
     "sad": "T ___ T",
 }
 
+LOOP_PERIOD = 0.1  # Seconds between sensor/control ticks
+READING_MAX_AGE = 1.0  # A reading older than this counts as missing (STM32 gone quiet)
+RX_BUFFER_LIMIT = 4096  # Upper bound for buffered serial bytes that never see a newline
+
+# STM32 frame: "[Light Detected: 1, Soil Humidity: 45.0]"
+READING_RE = re.compile(rb"Light Detected:\s*(\d+),\s*Soil Humidity:\s*([\d.]+)")
+
 class RobotState(BaseModel):
     """Pydantic model for the API response data structure."""
     light_val: int | None
@@ -24,6 +44,14 @@ class RobotState(BaseModel):
     current_face: str
     motor_state: str
 
+class StateSnapshot(TypedDict):
+    """Plain-dict form of RobotState built by RobotController.snapshot()."""
+    light_val: int | None
+    soil_val: float | None
+    distance_cm: float
+    current_face: str
+    motor_state: str
+
 # --- 2. RobotController Class (Core Logic) ---
 
 class RobotController:
@@ -31,15 +59,18 @@ class RobotController:
     def __init__(self, port="/dev/ttyACM0", baudrate=115200):
         # Serial connection (handle mock mode)
         try:
-            self.serial_conn = serial.Serial(port, baudrate, timeout=0.1)
+            self.serial_conn = serial.Serial(port, baudrate, timeout=0)
         except serial.SerialException as e:
             print(f"Warning: Could not open serial port {port}. Running in mock mode. Error: {e}")
             self.serial_conn = None
         
         # Hardware setup (handle mock mode)
         try:
-            # GPIO pin numbers are hardcoded as in the original script
-            self.distance_sensor = DistanceSensor(echo=23, trigger=24)
+            # GPIO pin numbers are hardcoded as in the original script.
+            # gpiozero pings on its own thread and .distance returns the queued average.
+            # Only reads before the short queue first fills (~0.3 s) wait, and the initial
+            # state below takes that one; partial=True would read 0 cm from an empty queue.
+            self.distance_sensor = DistanceSensor(echo=23, trigger=24, queue_len=5)
             self.motor_right = Motor(27, 22)
             self.motor_left = Motor(16, 20)
             self.hardware_initialized = True
@@ -58,14 +89,26 @@ class RobotController:
             self.motor_right = MockMotor()
             self.motor_left = MockMotor()
             self.distance_sensor = MockDistanceSensor()
+
+        # Distance source in cm, chosen once instead of branching every tick
+        if self.hardware_initialized:
+            self._read_dist = lambda sensor=self.distance_sensor: sensor.distance * 100
+        else:
+            self._read_dist = lambda: 50.0
         
         # State variables
         self.current_face = FACES["awake"]
         self.light_val = None
         self.soil_val = None
-        self.distance = self.distance_sensor.distance * 100
+        self.distance = self._read_dist()
         self.motor_state = "STOPPED"
-        self.lock = threading.Lock() # For thread-safe state updates
+        self._last_motor_cmd = (None, None)  # (action, speed) last sent to the motors
+        self._serial_buf = bytearray()  # Bytes received after the last complete line
+        self._last_reading = (None, None)
+        self._last_reading_at = 0.0  # time.monotonic() of the last parsed frame
+        # Published copy for the API: rebuilt by the sensor thread and swapped in with a
+        # single attribute store, so readers never need a lock
+        self._state = (self.light_val, self.soil_val, self.distance, self.current_face, self.motor_state)
 
         # Start background sensor reading thread
         self._stop_event = threading.Event()
@@ -77,17 +120,31 @@ class RobotController:
     def display_face(self, face):
         self.current_face = face
 
+    def _motor_cmd_unchanged(self, action, speed=None):
+        """True if this command is already applied; the control loop repeats it every tick."""
+        cmd = (action, speed)
+        if cmd == self._last_motor_cmd:
+            return True
+        self._last_motor_cmd = cmd
+        return False
+
     def stop_motors(self):
+        if self._motor_cmd_unchanged("stop"):
+            return
         self.motor_right.stop()
         self.motor_left.stop()
         self.motor_state = "STOPPED"
 
     def move_forward(self, speed=1.0):
+        if self._motor_cmd_unchanged("forward", speed):
+            return
         self.motor_right.forward(speed)
         self.motor_left.forward(speed)
         self.motor_state = f"FORWARD ({speed:.1f})"
 
     def rotate(self, speed=1.0):
+        if self._motor_cmd_unchanged("rotate", speed):
+            return
         self.motor_left.forward(speed)
         self.motor_right.backward(speed)
         self.motor_state = f"ROTATING ({speed:.1f})"
@@ -101,46 +158,61 @@ class RobotController:
             return 1, 50.0 
             
         try:
-            line = self.serial_conn.readline().decode("utf-8", errors="replace").strip()
-            if not line: return None, None
-
-            # Clean and parse the line (adapted from original logic)
-            line = line.replace("[", "").replace("]", "")
-            line = line.replace("Light Detected: ", "").replace("Soil Humidity: ", "")
-            parts = line.split(",")
-            
-            if len(parts) == 2:
-                light_val = int(parts[0].strip())
-                soil_val = float(parts[1].strip())
-                return light_val, soil_val
+            # Non-blocking: take whatever has arrived and keep the partial tail for next time
+            waiting = self.serial_conn.in_waiting
+            if waiting:
+                self._serial_buf += self.serial_conn.read(waiting)
+            end = self._serial_buf.rfind(b"\n")
+            if end < 0:
+                if len(self._serial_buf) > RX_BUFFER_LIMIT:
+                    self._serial_buf.clear()  # No framing in sight, drop the noise
+                # No new complete line yet: reuse the last reading while it is fresh
+                if time.monotonic() - self._last_reading_at > READING_MAX_AGE:
+                    self._last_reading = (None, None)
+                return self._last_reading
+            # The STM32 may send faster than we poll: only the newest line matters
+            start = self._serial_buf.rfind(b"\n", 0, end) + 1
+            # Copy the line out: a match on the bytearray itself would read its groups
+            # from whatever the buffer holds after the del below
+            line = bytes(self._serial_buf[start:end])
+            del self._serial_buf[:end + 1]
+            match = READING_RE.search(line)
+
+            if match:
+                self._last_reading = (int(match[1]), float(match[2]))
+                self._last_reading_at = time.monotonic()
+                return self._last_reading
+            self._last_reading = (None, None)
         except Exception as e:
-            # print(f"[Parse Error] {e}")
-            pass
+            print(f"[Parse Error] {e}")
+            self._last_reading = (None, None)
         return None, None
 
     def _sensor_reader_loop(self):
         """Background thread loop to continuously read sensors and run control logic."""
+        next_tick = time.monotonic()
         while not self._stop_event.is_set():
             light_val, soil_val = self.read_sensor_line()
             
-            distance = self.distance_sensor.distance * 100 if self.hardware_initialized else 50.0
+            distance = self._read_dist()
 
-            with self.lock:
-                self.light_val = light_val
-                self.soil_val = soil_val
-                self.distance = distance
+            self.light_val = light_val
+            self.soil_val = soil_val
+            self.distance = distance
             
-            self.run_control_logic()
-
-            time.sleep(0.1) # Loop pacing
+            self._apply(light_val, soil_val, distance)
+            self._state = (light_val, soil_val, distance, self.current_face, self.motor_state)
+
+            # Loop pacing on fixed monotonic ticks; a missed tick is skipped, not made up
+            next_tick += LOOP_PERIOD
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                self._stop_event.wait(delay)  # Returns at once when close() is called
+            else:
+                next_tick = time.monotonic()
 
-    def run_control_logic(self):
-        """Applies control logic based on sensor state."""
-        with self.lock:
-            light_val = self.light_val
-            soil_val = self.soil_val
-            distance = self.distance
-        
+    def _apply(self, light_val, soil_val, distance):
+        """Applies control logic to this tick's readings."""
         # --- Control Logic (Same as original script) ---
         if light_val is None or soil_val is None:
             self.display_face(FACES["sad"])
@@ -167,22 +239,24 @@ class RobotController:
                 self.rotate(speed=1.0)
 
 
-    def get_state(self) -> RobotState:
-        """Returns the current state of the robot for the API."""
-        with self.lock:
-            return RobotState(
-                light_val=self.light_val,
-                soil_val=self.soil_val,
-                distance_cm=self.distance,
-                current_face=self.current_face,
-                motor_state=self.motor_state
-            )
+    def snapshot(self) -> StateSnapshot:
+        """Returns the current state of the robot for the API (shaped like RobotState)."""
+        light_val, soil_val, distance, face, motor = self._state
+        return {
+            "light_val": light_val,
+            "soil_val": soil_val,
+            "distance_cm": distance,
+            "current_face": face,
+            "motor_state": motor,
+        }
 
     def close(self):
         """Cleanup resources on shutdown."""
-        self.stop_motors()
+        # Stop the control loop first so nothing drives the motors after the final stop
         self._stop_event.set()
         self._sensor_thread.join(timeout=1)
+        self._last_motor_cmd = (None, None)  # Always send the final stop
+        self.stop_motors()
         if self.serial_conn and self.serial_conn.is_open:
             self.serial_conn.close()
 
@@ -190,35 +264,47 @@ class RobotController:
 
 app = FastAPI()
 
-# Global instance of the robot controller
-try:
-    ROBOT = RobotController()
-except Exception as e:
-    print(f"FATAL: Error initializing RobotController: {e}")
-    # Handle critical error appropriately (e.g., raise or use a mock)
+@functools.lru_cache(maxsize=1)
+def get_robot() -> RobotController:
+    """Single shared robot controller, created on first use rather than at import."""
+    return RobotController()
+
+async def get_robot_dep() -> RobotController:
+    """Route dependency; async so FastAPI does not hop to the threadpool per request."""
+    return get_robot()
+
+@app.on_event("startup")
+def startup_event():
+    """Open the hardware once the server is actually starting."""
+    try:
+        get_robot()
+    except Exception as e:
+        print(f"FATAL: Error initializing RobotController: {e}")
+        # Handle critical error appropriately (e.g., raise or use a mock)
 
 @app.on_event("shutdown")
 def shutdown_event():
     """Ensure cleanup function runs when the server stops."""
+    if not get_robot.cache_info().currsize:
+        return
     print("[FastAPI] Shutting down robot...")
-    ROBOT.close()
+    get_robot().close()
+    get_robot.cache_clear()  # A later startup in this process builds a fresh controller
     print("[FastAPI] Shutdown complete.")
 
 # --- 4. API Endpoint ---
 
-@app.get("/state", response_model=RobotState)
-async def get_robot_state():
+# RobotState only documents the schema; returning a Response skips FastAPI's
+# validation and jsonable_encoder pass, leaving a single orjson encode per request
+@app.get("/state", responses={200: {"model": RobotState}})
+async def get_robot_state(robot: RobotController = Depends(get_robot_dep)):
     """API endpoint to get the current sensor and motor state."""
-    return ROBOT.get_state()
+    return Response(content=_json_dumps(robot.snapshot()), media_type="application/json")
 
 # --- 5. Frontend HTML Endpoint ---
 
-@app.get("/", response_class=HTMLResponse)
-async def serve_frontend(request: Request):
-    """Serves the main HTML dashboard page."""
-    
-    # We embed the HTML/JS directly in the Python file for the single-file request
-    html_content = f"""
+# The page is fully static: encode it once and hand every request the same response
+DASHBOARD_HTML = """
 <!DOCTYPE html>
 <html lang="en">
 <head>
@@ -226,17 +312,17 @@ async def serve_frontend(request: Request):
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Robot Dashboard</title>
     <style>
-        body {{ font-family: Arial, sans-serif; display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0; background-color: #f4f4f9; }}
-        .dashboard {{ background: #fff; padding: 30px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); width: 400px; }}
-        h1 {{ text-align: center; color: #333; }}
-        .face-display {{ font-size: 3em; text-align: center; margin: 20px 0; padding: 10px; border: 2px solid #ccc; border-radius: 5px; background-color: #e9e9e9; }}
-        .sensor-item {{ display: flex; justify-content: space-between; padding: 10px 0; border-bottom: 1px dashed #ddd; }}
-        .sensor-item:last-child {{ border-bottom: none; }}
-        .label {{ font-weight: bold; color: #555; }}
-        .value {{ color: #007bff; }}
-        .status-good {{ color: green; }}
-        .status-warn {{ color: orange; }}
-        .status-bad {{ color: red; }}
+        body { font-family: Arial, sans-serif; display: flex; justify-content: center; align-items: center; height: 100vh; margin: 0; background-color: #f4f4f9; }
+        .dashboard { background: #fff; padding: 30px; border-radius: 10px; box-shadow: 0 4px 8px rgba(0,0,0,0.1); width: 400px; }
+        h1 { text-align: center; color: #333; }
+        .face-display { font-size: 3em; text-align: center; margin: 20px 0; padding: 10px; border: 2px solid #ccc; border-radius: 5px; background-color: #e9e9e9; }
+        .sensor-item { display: flex; justify-content: space-between; padding: 10px 0; border-bottom: 1px dashed #ddd; }
+        .sensor-item:last-child { border-bottom: none; }
+        .label { font-weight: bold; color: #555; }
+        .value { color: #007bff; }
+        .status-good { color: green; }
+        .status-warn { color: orange; }
+        .status-bad { color: red; }
     </style>
 </head>
 <body>
@@ -280,8 +366,8 @@ async def serve_frontend(request: Request):
     /**
      * Fetches robot state and updates the dashboard.
      */
-    async function updateDashboard() {{
-        try {{
+    async function updateDashboard() {
+        try {
             const response = await fetch(API_URL);
             const state = await response.json();
 
@@ -289,12 +375,12 @@ async def serve_frontend(request: Request):
             lightOutput.textContent = state.light_val !== null ? (state.light_val === 1 ? '💡 Detected' : '🌑 Dark') : 'N/A';
             lightOutput.className = state.light_val === 1 ? 'value status-good' : 'value status-bad';
             
-            soilOutput.textContent = state.soil_val !== null ? `${{state.soil_val.toFixed(1)}} %` : 'N/A';
-            if (state.soil_val !== null) {{
+            soilOutput.textContent = state.soil_val !== null ? `${state.soil_val.toFixed(1)} %` : 'N/A';
+            if (state.soil_val !== null) {
                 soilOutput.className = state.soil_val >= 50 ? 'value status-good' : (state.soil_val >= 30 ? 'value status-warn' : 'value status-bad');
-            }} else {{
+            } else {
                 soilOutput.className = 'value';
-            }}
+            }
             
             distanceOutput.textContent = state.distance_cm.toFixed(1) + ' cm';
             distanceOutput.className = state.distance_cm > 30 ? 'value status-good' : 'value status-warn';
@@ -303,15 +389,15 @@ async def serve_frontend(request: Request):
             faceOutput.textContent = state.current_face;
             motorOutput.textContent = state.motor_state;
 
-        }} catch (error) {{
+        } catch (error) {
             console.error('Failed to fetch robot state:', error);
             lightOutput.textContent = 'ERROR';
             soilOutput.textContent = 'ERROR';
             distanceOutput.textContent = 'ERROR';
             faceOutput.textContent = 'X ___ X';
             motorOutput.textContent = 'UNKNOWN';
-        }}
-    }}
+        }
+    }
 
     // Update the dashboard every 1000 milliseconds (1 second)
     setInterval(updateDashboard, 1000);
@@ -323,8 +409,14 @@ async def serve_frontend(request: Request):
 
 </body>
 </html>
-    """
-    return HTMLResponse(content=html_content)
+    """.encode("utf-8")
+DASHBOARD_RESPONSE = HTMLResponse(content=DASHBOARD_HTML, headers={"Cache-Control": "public, max-age=3600"})
+
+@app.get("/", response_class=HTMLResponse)
+async def serve_frontend(request: Request):
+    """Serves the main HTML dashboard page."""
+    # We embed the HTML/JS directly in the Python file for the single-file request
+    return DASHBOARD_RESPONSE
 
 # --- 6. Execution Block (Standard Python Run) ---
 
@@ -333,6 +425,7 @@ if __name__ == "__main__":
     try:
         import uvicorn
         print("Starting FastAPI server. Access the dashboard at http://127.0.0.1:8000/")
-        uvicorn.run(app, host="0.0.0.0", port=8000)
+        uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", http="httptools",
+                    log_level="warning", access_log=False)
     except ImportError:
         print("Uvicorn not installed. Please install it with 'pip install uvicorn'.")
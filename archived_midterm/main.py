@@ -1,12 +1,38 @@
+import os
+import re
 import serial
+from serial.threaded import Packetizer, ReaderThread
 import threading
 import time
-import ast
 import random
 # import RPi.GPIO as GPIO
 from gpiozero import Motor, DistanceSensor
 from RPLCD.i2c import CharLCD
 
+# Per-frame / per-loop prints are debug output; set ROBOT_DEBUG=1 to see them
+DEBUG = os.getenv("ROBOT_DEBUG", "0").lower() in ("1", "true", "yes")
+
+# Fastest the LCD face is redrawn; quicker changes just flicker and load the I2C bus
+LCD_MIN_INTERVAL = 0.25
+
+# One STM32 frame, e.g. b"[Light Detected: 1, Soil Humidity: 45.0]"
+FRAME_RE = re.compile(rb"\[Light Detected:\s*(\d+),\s*Soil Humidity:\s*(\d+(?:\.\d+)?)\]")
+
+
+class SensorProtocol(Packetizer):
+    """Splits the STM32 byte stream into newline-terminated frames for a SensorReader."""
+    TERMINATOR = b"\n"
+
+    def __init__(self, reader):
+        super().__init__()
+        self.reader = reader
+
+    def handle_packet(self, packet):
+        self.reader._handle_frame(packet)
+
+    def connection_lost(self, exc):
+        if exc:
+            print(f"[SensorReader] Read error: {exc}")
 
 
 class SensorReader:
@@ -15,43 +41,54 @@ class SensorReader:
         self.baudrate = baudrate
         self.serial_conn = None
         self.running = False
-        self.latest_values = []
+        # (light, soil humidity); replaced whole by the reader thread, never mutated
+        self.latest_values = ()
+        self._reader_thread = None
+        self._new_data = threading.Event()  # Set when latest_values holds an unread frame
 
     def start(self):
         try:
             self.serial_conn = serial.Serial(self.port, self.baudrate, timeout=1)
+            try:
+                # USB-serial drivers may hold short frames for up to 16 ms otherwise;
+                # drivers without ASYNC_LOW_LATENCY support just keep their default
+                self.serial_conn.set_low_latency_mode(True)
+            except (AttributeError, NotImplementedError, ValueError, OSError):
+                pass
             self.running = True
-            threading.Thread(target=self._read_loop, daemon=True).start()
+            # pyserial's reader thread reads whatever is waiting in one call and
+            # the protocol buffers partial frames between reads
+            self._reader_thread = ReaderThread(self.serial_conn, lambda: SensorProtocol(self))
+            self._reader_thread.start()
             print("SensorReader started.")
         except serial.SerialException as e:
             print(f"[SensorReader] Serial Error: {e}")
 
     def stop(self):
         self.running = False
+        if self._reader_thread:
+            self._reader_thread.stop()
         if self.serial_conn and self.serial_conn.is_open:
             self.serial_conn.close()
         print("SensorReader stopped.")
 
-    def _read_loop(self):
-        while self.running and self.serial_conn and self.serial_conn.is_open:
-            try:
-                line = self.serial_conn.readline().decode("utf-8", errors="replace").strip()
-                if line.startswith("[") and line.endswith("]"):
-                    try:
-                        values = ast.literal_eval(line)
-                        if isinstance(values, list):
-                            self.latest_values = values
-                            print(f"[SensorReader] Received: {values}")
-                    except Exception as e:
-                        print(f"[SensorReader] Parse error: {e}")
-            except Exception as e:
-                print(f"[SensorReader] Read error: {e}")
-            
-            line = self.serial_conn.readline().decode("utf-8", errors="replace").strip()
-            self.latest_values = line
-            time.sleep(0.1)
-
-    def get_latest_values(self):
+    def _handle_frame(self, frame):
+        # Validates the frame and extracts both fields in one match
+        match = FRAME_RE.fullmatch(frame.strip())
+        if match is None:
+            if DEBUG:
+                print(f"[SensorReader] Parse error: {frame!r}")
+            return
+        values = (int(match[1]), float(match[2]))
+        self.latest_values = values
+        self._new_data.set()
+        if DEBUG:
+            print(f"[SensorReader] Received: {values}")
+
+    def get_latest_values(self, timeout=None):
+        """Waits up to timeout for a frame newer than the last call, then returns the latest."""
+        self._new_data.wait(timeout)
+        self._new_data.clear()
         return self.latest_values
         
 
@@ -61,7 +98,21 @@ def main():
 	lcd = CharLCD(i2c_expander='PCF8574', address=0x27, port=1, cols=16, rows=2, dotsize=8)
 	lcd.clear()
 	sensor_reader = SensorReader(port="/dev/ttyACM0", baudrate=115200)
-	distanceSensor = DistanceSensor(echo=23, trigger=24)
+	# gpiozero pings on its own thread and .distance reads the queued average.
+	# Without partial=True only reads before the short queue has filled (~0.3 s)
+	# wait; an empty partial queue would read as 0 cm.
+	distanceSensor = DistanceSensor(echo=23, trigger=24, queue_len=5, threshold_distance=0.15)
+	# The motors only care whether something is within 15 cm: let gpiozero's
+	# thread flip this on threshold crossings instead of reading every pass
+	obstacle = threading.Event()
+	distanceSensor.when_in_range = obstacle.set
+	distanceSensor.when_out_of_range = obstacle.clear
+	# gpiozero fires no callback for the first state it sees, so seed the flag
+	# from a real reading (this blocks until the queue holds samples)
+	if distanceSensor.in_range:
+		obstacle.set()
+	else:
+		obstacle.clear()
 	motor_right = Motor(27, 22)
 	motor_left = Motor(20, 16)
 	
@@ -74,6 +125,8 @@ def main():
 	face_sad = "T ___ T"
 	
 	face_patterns = [face_awake, face_sleep, face_tired, face_sad]
+	# LCD row text for each face, centred once up front
+	face_rows = {face: face.center(16) for face in face_patterns}
 	
 	
 	try:
@@ -85,45 +138,44 @@ def main():
 		
 		current_face = face_awake
 		
-		lcd.cursor_pos = (1,0)
+		# Face currently shown on the LCD; only a change is written over I2C
+		lcd_face = None
+		lcd_written_at = 0.0
+		last_report = None
 		
 		while True:
-			lcd.write_string(current_face.center(16))
-			light, soil_humidity = 0,0
-			values = sensor_reader.get_latest_values()
-
-			if len(str(values).split(",")) == 2: 
-				for i in range(len(str(values).split(","))):
-					if i == 0:
-						light = str(values).split(",")[i]
-					else:
-						soil_humidity = str(values).split(",")[i]
-			
+			now = time.monotonic()
+			if current_face != lcd_face and now - lcd_written_at >= LCD_MIN_INTERVAL:
+				# A centred 16-char row overwrites the old face, so no clear() is needed
+				lcd.cursor_pos = (1,0)
+				lcd.write_string(face_rows[current_face])
+				lcd_face = current_face
+				lcd_written_at = now
+			# Wakes as soon as a new frame arrives, or after 0.2 s with the last one
+			values = sensor_reader.get_latest_values(timeout=0.2)
 			
-			light_val = -999
-			soil_humidity_val = -999
+			# (light, soil humidity) as parsed by SensorReader; -999 until the first frame
+			light_val, soil_humidity_val = values if len(values) == 2 else (-999, -999)
 			
-			
-			if type(light) == str and type(soil_humidity) == str:						
-				light_val = light.split(" ")[-1]
-				soil_humidity_val = soil_humidity[:-1].split(" ")[-1]
-			
-			distance = distanceSensor.distance * 100
-			print(f"from stm32: light {light_val}, soil {soil_humidity_val}, distance: {distance}")
+			if DEBUG:
+				distance = distanceSensor.distance * 100
+				# Only report when a reading changes (distance to the whole cm)
+				report = (light_val, soil_humidity_val, round(distance))
+				if report != last_report:
+					last_report = report
+					print(f"from stm32: light {light_val}, soil {soil_humidity_val}, distance: {distance}")
 			
 			# if dark stop motor
 			if not int(light_val):
 				motor_right.stop()
 				motor_left.stop()
 				current_face = face_sleep
-				time.sleep(0.2)
-				lcd.clear()
 				continue
 			
 			# if not enough humidity, move slower
 			if float(soil_humidity_val) < 30:
 				current_face = face_tired
-				if distance > 15:
+				if not obstacle.is_set():
 					motor_right.forward(speed=0.4)
 					motor_left.forward(speed=0.4)
 				else:
@@ -131,7 +183,7 @@ def main():
 					motor_right.backward(speed=0.4)
 			else:	
 				current_face = face_awake			
-				if distance > 15:
+				if not obstacle.is_set():
 					motor_right.forward(speed=0.7)
 					motor_left.forward(speed=0.7)
 				else:
@@ -154,9 +206,6 @@ def main():
 							
 			#print(current_face)
 			
-			time.sleep(0.2)
-			lcd.clear()
-			
 	except KeyboardInterrupt:
 		print("\n[Main] Interrupted by user.")
 	finally:
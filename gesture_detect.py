@@ -1,10 +1,13 @@
 import os
+import queue
+import threading
 import time
 from typing import Optional
 
 import cv2
 import mediapipe as mp
 import requests
+from requests.adapters import HTTPAdapter
 
 # Config
 API_ENDPOINT = os.getenv("GESTURE_ENDPOINT", "http://localhost:8000/gesture")
@@ -12,14 +15,55 @@ POST_TIMEOUT = float(os.getenv("GESTURE_TIMEOUT", "0.5"))
 COOLDOWN_SECONDS = float(os.getenv("GESTURE_COOLDOWN", "0.2"))
 HEADLESS = os.getenv("GESTURE_HEADLESS", "1").lower() in ("1", "true", "yes")
 
+# MediaPipe's palm detector scales with pixel count, so capture small and only
+# upscale the preview window
+CAPTURE_SIZE = (320, 240)
+DISPLAY_SIZE = (640, 480)
+
 # Initialize MediaPipe Hands
 mp_hands = mp.solutions.hands
 mp_draw = mp.solutions.drawing_utils
 
-# Initialize webcam
+# Initialize webcam: MJPG is cheaper to decode than YUYV on the Pi, and a one-frame
+# driver buffer keeps the backend from handing us frames that are already stale
 cap = cv2.VideoCapture(0)
-cap.set(3, 640)
-cap.set(4, 480)
+cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+cap.set(3, CAPTURE_SIZE[0])
+cap.set(4, CAPTURE_SIZE[1])
+cap.set(cv2.CAP_PROP_FPS, 30)
+cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+
+class LatestFrameReader:
+    """Reads the camera on a background thread and keeps only the newest frame."""
+
+    def __init__(self, capture):
+        self._capture = capture
+        self._latest = (True, None)  # (success, frame), replaced as one object
+        self._ready = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._reader_loop, daemon=True)
+        self._thread.start()
+
+    def _reader_loop(self):
+        while self._running:
+            success, frame = self._capture.read()
+            self._latest = (success, frame)
+            self._ready.set()
+            if not success:
+                break
+
+    def read(self):
+        """Waits for a frame newer than the last one returned."""
+        self._ready.wait()
+        self._ready.clear()
+        return self._latest
+
+    def stop(self):
+        self._running = False
+        self._thread.join(timeout=1)
+
+frames = LatestFrameReader(cap)
 
 # Hand tracking model
 hands = mp_hands.Hands(
@@ -37,6 +81,34 @@ last_sent = {
 }
 
 
+# Single pending update for the poster thread; a newer gesture replaces an unsent one
+post_queue = queue.Queue(maxsize=1)
+
+# One kept-alive connection to the backend instead of a new TCP connect per update;
+# only the poster thread uses it
+session = requests.Session()
+session.mount("http://", HTTPAdapter(pool_connections=1, pool_maxsize=1))
+
+
+def _post_worker():
+    """Delivers queued updates so a slow server never stalls the camera loop."""
+    last_error = 0.0
+    while True:
+        payload = post_queue.get()
+        try:
+            session.post(API_ENDPOINT, json=payload, timeout=POST_TIMEOUT)
+            print(f"[gesture_detect] Sent: {payload['gesture']} -> {payload['mode']}")
+        except requests.RequestException as exc:
+            # Print once per cooldown window even if the server is down
+            now = time.time()
+            if (now - last_error) >= COOLDOWN_SECONDS:
+                last_error = now
+                print(f"[gesture_detect] Failed to send update: {exc}")
+
+
+threading.Thread(target=_post_worker, daemon=True).start()
+
+
 def send_gesture_update(gesture: Optional[str], mode: Optional[str]):
     """Send gesture/mode to the FastAPI backend with basic throttling."""
     now = time.time()
@@ -46,70 +118,67 @@ def send_gesture_update(gesture: Optional[str], mode: Optional[str]):
 
     payload = {"gesture": gesture, "mode": mode}
     try:
-        requests.post(API_ENDPOINT, json=payload, timeout=POST_TIMEOUT)
-        last_sent.update({"gesture": gesture, "mode": mode, "timestamp": now})
-        print(f"[gesture_detect] Sent: {gesture} -> {mode}")
-    except requests.RequestException as exc:
-        # Print once per cooldown window even if the server is down
-        if (now - last_sent["timestamp"]) >= COOLDOWN_SECONDS:
-            print(f"[gesture_detect] Failed to send update: {exc}")
+        post_queue.put_nowait(payload)
+    except queue.Full:
+        # Newest wins: drop the unsent update (this thread is the only producer)
+        try:
+            post_queue.get_nowait()
+        except queue.Empty:
+            pass
+        post_queue.put_nowait(payload)
+    last_sent.update({"gesture": gesture, "mode": mode, "timestamp": now})
+
+# Landmark indices: thumb tip vs. its IP joint, then (tip, PIP joint) of the other fingers
+THUMB_TIP, THUMB_IP = 4, 3
+FINGER_JOINTS = ((8, 6), (12, 10), (16, 14), (20, 18))
+
+# Gesture mapping by number of raised fingers, and the robot mode each one selects
+GESTURE_BY_COUNT = {0: "fist", 1: "one", 5: "open"}
+GESTURE_ACTIONS = {"fist": "forward", "one": "spin", "open": "wave"}
+
+# Both tables folded over every 5-bit finger mask: one lookup per frame
+NO_GESTURE = (None, None)
+GESTURE_BY_MASK = {
+    mask: (gesture, GESTURE_ACTIONS[gesture])
+    for mask in range(32)
+    if (gesture := GESTURE_BY_COUNT.get(mask.bit_count())) is not None
+}
+
+def finger_mask(landmarks):
+    """Raised fingers as a 5-bit mask: bit 0 is the thumb, bits 1-4 index to pinky."""
+    # Thumb is raised along the x-axis, the other four fingers along the y-axis
+    mask = int(landmarks[THUMB_TIP].x < landmarks[THUMB_IP].x)
+    for bit, (tip, pip) in enumerate(FINGER_JOINTS, 1):
+        mask |= (landmarks[tip].y < landmarks[pip].y) << bit
+    return mask
 
 def classify_gesture(landmarks):
-    """Classify gesture based on finger positions."""
-    tips = [4, 8, 12, 16, 20]
-    fingers = []
+    """Classify gesture based on finger positions, as a (gesture, action) pair."""
+    return GESTURE_BY_MASK.get(finger_mask(landmarks), NO_GESTURE)
 
-    # Thumb (check x-axis direction)
-    if landmarks[tips[0]].x < landmarks[tips[0] - 1].x:
-        fingers.append(1)
-    else:
-        fingers.append(0)
-
-    # Other four fingers (check y-axis direction)
-    for i in range(1, 5):
-        if landmarks[tips[i]].y < landmarks[tips[i] - 2].y:
-            fingers.append(1)
-        else:
-            fingers.append(0)
-
-    total = fingers.count(1)
-
-    # Gesture mapping
-    if total == 0:
-        return "fist"
-    elif total == 1:
-        return "one"
-    elif total == 5:
-        return "open"
-    else:
-        return "none"
+# Preview overlay text per mode, formatted once
+OVERLAY_TEXT = {mode: f"Mode: {mode}" for mode in ("forward", "spin", "wave", "standby")}
+
+# RGB copy for MediaPipe, converted into the same buffer every frame
+img_rgb = None
 
 while True:
-    success, img = cap.read()
+    success, img = frames.read()
     if not success:
         break
 
-    img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    if img_rgb is None or img_rgb.shape != img.shape:
+        img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    else:
+        cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img_rgb)
     results = hands.process(img_rgb)
 
-    gesture = "none"
-    action = "stop"
+    gesture, action = NO_GESTURE
 
     if results.multi_hand_landmarks:
         for handLms in results.multi_hand_landmarks:
             mp_draw.draw_landmarks(img, handLms, mp_hands.HAND_CONNECTIONS)
-            gesture = classify_gesture(handLms.landmark)
-
-    # Map gestures to actions
-    if gesture == "fist":
-        action = "forward"
-    elif gesture == "one":
-        action = "spin"
-    elif gesture == "open":
-        action = "wave"
-    else:
-        gesture = None
-        action = None
+            gesture, action = classify_gesture(handLms.landmark)
 
     # Print and display
     if action:
@@ -119,14 +188,15 @@ while True:
         send_gesture_update(None, None)
 
     if not HEADLESS:
-        display_text = action or "standby"
-        cv2.putText(img, f"Mode: {display_text}", (10, 50),
+        img = cv2.resize(img, DISPLAY_SIZE, interpolation=cv2.INTER_NEAREST)
+        cv2.putText(img, OVERLAY_TEXT[action or "standby"], (10, 50),
                     cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
         cv2.imshow("Gesture Control", img)
         # Exit with 'q'
         if cv2.waitKey(delay=1) & 0xFF == ord('q'):
             break
 
+frames.stop()
 cap.release()
 if not HEADLESS:
     cv2.destroyAllWindows()